@@ -1,8 +1,8 @@
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.agents import AgentExecutor
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import SystemMessage
 from langchain.tools import tool
-from langsmith import traceable
 from langchain_community.tools.shell.tool import ShellTool
 from langchain.agents.format_scratchpad.openai_tools import (
     format_to_openai_tool_messages,
@@ -10,50 +10,326 @@ from langchain.agents.format_scratchpad.openai_tools import (
 from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
 import subprocess
 from dotenv import load_dotenv
+from openai import OpenAI
 from langchain.globals import set_llm_cache
-from langchain_community.cache import SQLiteCache
-from typing import Optional
+from langchain_community.cache import SQLAlchemyCache
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from uuid import UUID
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from typing import Any, Optional
 from pathlib import Path
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
+import fnmatch
+import functools
+import hashlib
+import json
+import mmap
+import numpy as np
 import os
+import pygit2
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
 
 load_dotenv()
-set_llm_cache(SQLiteCache(database_path=".langchain.db"))
+# LangSmith tracing posts every tool and LLM run synchronously, keep it off for the sweep
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+# WAL lets the parallel workers read the cache while another one writes to it
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=30000000000",
+    "PRAGMA wal_autocheckpoint=1000",
+]
+
+def create_cache_engine(database_path: str):
+    """
+    Creates a pooled SQLite engine for the LLM cache with the pragmas applied to every connection.
+    """
+    engine = create_engine(
+        f"sqlite:///{database_path}",
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+class ShardedSQLiteCache(BaseCache):
+    """
+    Spreads the LLM cache over several SQLite files so parallel workers don't queue on a single writer.
+    Each prompt is routed to a shard by a hash of the prompt and the llm string.
+    """
+
+    def __init__(self, database_path: str = ".langchain.db", shards: int = 16):
+        self.shards = [
+            SQLAlchemyCache(create_cache_engine(f"{database_path}.{i}"))
+            for i in range(shards)
+        ]
+
+    def _shard(self, prompt: str, llm_string: str) -> SQLAlchemyCache:
+        key = zlib.crc32((prompt + llm_string).encode("utf-8"))
+        return self.shards[key % len(self.shards)]
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self._shard(prompt, llm_string).lookup(prompt, llm_string)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._shard(prompt, llm_string).update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        for shard in self.shards:
+            shard.clear(**kwargs)
+
+class SemanticCache(BaseCache):
+    """
+    Serves a cached completion for prompts similar enough to one answered before in this run.
+    The exact-match cache is always consulted first, only temperature 0 calls are matched semantically.
+    """
+
+    def __init__(self, cache: BaseCache, threshold: float = 0.92, embeddings=None):
+        self.cache = cache
+        self.threshold = threshold
+        self.embeddings = embeddings or OpenAIEmbeddings(model="text-embedding-3-small")
+        self.entries: dict[str, tuple[list, list]] = {}
+        self.pending: dict[tuple[str, str], np.ndarray] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _is_deterministic(llm_string: str) -> bool:
+        # llm_string is the serialized model JSON, "---", then the call kwargs as Python tuples
+        model, _, call_kwargs = llm_string.partition("---")
+        try:
+            temperature = json.loads(model).get("kwargs", {}).get("temperature")
+        except (ValueError, AttributeError):
+            return False
+        override = re.search(r"\('temperature', ([0-9.]+)\)", call_kwargs)
+        if override:
+            temperature = float(override.group(1))
+        return temperature == 0
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.array(self.embeddings.embed_query(prompt))
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        result = self.cache.lookup(prompt, llm_string)
+        if result is not None or not self._is_deterministic(llm_string):
+            return result
+        vector = self._embed(prompt)
+        with self.lock:
+            self.pending[(prompt, llm_string)] = vector
+            vectors, values = self.entries.get(llm_string, ([], []))
+            if not vectors:
+                return None
+            scores = np.stack(vectors) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            # A hit never reaches update()
+            del self.pending[(prompt, llm_string)]
+            return values[best]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.cache.update(prompt, llm_string, return_val)
+        if not self._is_deterministic(llm_string):
+            return
+        with self.lock:
+            vector = self.pending.pop((prompt, llm_string), None)
+        if vector is None:
+            vector = self._embed(prompt)
+        with self.lock:
+            vectors, values = self.entries.setdefault(llm_string, ([], []))
+            vectors.append(vector)
+            values.append(return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear(**kwargs)
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+
+# Prompts of different finders differ only by the finder path, so a semantic hit can hand back
+# tool calls meant for another finder. Opt in with SEMANTIC_CACHE=true.
+if os.getenv("SEMANTIC_CACHE", "false").lower() == "true":
+    set_llm_cache(SemanticCache(ShardedSQLiteCache(".langchain.db")))
+else:
+    set_llm_cache(ShardedSQLiteCache(".langchain.db"))
 
 ROOT_DIR = "."
+ROOT_PATH = Path(ROOT_DIR).resolve()
 REPO_DIR = "cloudfix-aws"
-VALID_FILE_TYPES = {"py", "txt", "md", "cpp", "c", "java", "js", "html", "css", "ts", "json"}
+FINDERS_DIR = os.path.join(REPO_DIR, "cloudfix-ff", "src", "ff")
+WORKTREES_DIR = "worktrees"
+BASE_BRANCH = "qa"
+MAX_WORKERS = 8
+RETRY_ATTEMPTS = 5
+# A finder still running after HEDGE_DELAY seconds gets a parallel attempt in a spare worktree
+HEDGE_DELAY = 600
+MAX_AGENT_ITERATIONS = 20
+# Longer than the 300s one might expect, a single compile can take minutes
+MAX_AGENT_EXECUTION_TIME = 900
+# An agent repeating the same tool call this many times in a row is stuck
+NO_PROGRESS_REPEATS = 3
+SPARE_WORKTREES = 4
+# Directories find_file never descends into
+SKIPPED_DIRS = frozenset({".git", "node_modules", "dist"})
+# Files above MAX_FILE_BYTES are returned to the LLM as head + tail only
+MAX_FILE_BYTES = 64 * 1024
+HEAD_FILE_BYTES = 32 * 1024
+TAIL_FILE_BYTES = 16 * 1024
+# Output kept from yarn/npm per stream, the LLM doesn't need more
+MAX_OUTPUT_BYTES = 64 * 1024
+COMMAND_TIMEOUT = 600
+# compile/lint results keyed by the working tree they ran on
+CHECKS_CACHE_DIR = Path.home() / ".cache" / "ai-school"
+# Draft the reports through the OpenAI Batch API before the agents start (half the token price)
+BATCH_DRAFTS = os.getenv("BATCH_DRAFTS", "true").lower() == "true"
+BATCH_POLL_INTERVAL = 60
+# The sweep starts without drafts when the batch takes longer than this
+BATCH_MAX_WAIT = 2 * 60 * 60
+REFERENCE_FINDER = "cloudfix-aws/cloudfix-ff/src/ff/Ebs/Retype/Gp2Volumes"
+# Number of agents allowed to talk to OpenAI at the same time, keeps us under the RPM limit
+MAX_CONCURRENT_AGENTS = 4
+# Part of MAX_CONCURRENT_AGENTS kept for hedged attempts, the workers queued for the others never leave one free
+HEDGE_AGENTS = 1
+VALID_FILE_TYPES = frozenset({"py", "txt", "md", "cpp", "c", "java", "js", "html", "css", "ts", "json"})
 
 yarn_path = r"C:\Program Files\nodejs\yarn.cmd"
 npm_path = r"C:\Program Files\nodejs\npm.cmd"
 
+# Each worker thread runs the agent in its own git worktree, the tools resolve paths against it
+worker_root: ContextVar[Path] = ContextVar("worker_root", default=ROOT_PATH)
+# Together the two never let more than MAX_CONCURRENT_AGENTS agents run
+agent_slots = threading.Semaphore(MAX_CONCURRENT_AGENTS - HEDGE_AGENTS)
+hedge_slots = threading.Semaphore(HEDGE_AGENTS)
+# Parallel agents ask for shell confirmations one at a time
+shell_input_lock = threading.Lock()
+# The tool calls of a turn run concurrently, tools changing a worktree take its lock so only reads overlap
+worktree_locks: dict[Path, threading.Lock] = {}
+worktree_locks_guard = threading.Lock()
+
+def root_path() -> Path:
+    """Returns the root directory of the current worker."""
+    return worker_root.get()
+
+def worktree_lock() -> threading.Lock:
+    """Returns the lock of the current worker root."""
+    with worktree_locks_guard:
+        return worktree_locks.setdefault(root_path(), threading.Lock())
+
+def writes_worktree(func):
+    """Runs the tool holding the worktree lock, for tools that write files or run git/yarn/npm."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with worktree_lock():
+            return func(*args, **kwargs)
+    return wrapper
+
+def repo_dir() -> str:
+    """Returns the cloudfix-aws checkout of the current worker."""
+    return os.path.join(root_path(), REPO_DIR)
+
+# pygit2 repositories are not thread safe, every thread keeps its own handles
+thread_repositories = threading.local()
+
+def repository() -> pygit2.Repository:
+    """Returns the libgit2 handle of the current worker checkout, opened once per thread."""
+    if not hasattr(thread_repositories, "by_path"):
+        thread_repositories.by_path = {}
+    path = repo_dir()
+    if path not in thread_repositories.by_path:
+        thread_repositories.by_path[path] = pygit2.Repository(path)
+    return thread_repositories.by_path[path]
+
+def reset_to_base_branch():
+    """
+    Equivalent of git reset --hard, git checkout --detach qa, git clean -fd without spawning git.
+    """
+    repo = repository()
+    commit = repo.revparse_single(BASE_BRANCH).peel(pygit2.Commit)
+    repo.set_head(commit.id)
+    repo.reset(commit.id, pygit2.GIT_RESET_HARD)
+    workdir = Path(repo.workdir)
+    for path, flags in repo.status(untracked_files="all").items():
+        if flags & pygit2.GIT_STATUS_WT_NEW:
+            file_path = workdir.joinpath(path)
+            file_path.unlink()
+            for parent in file_path.parents:
+                if parent == workdir or any(parent.iterdir()):
+                    break
+                parent.rmdir()
+
 @tool
+@writes_worktree
 def create_directory(directory: str) -> str:
     """
     Creates a new writable directory with the given name if it does not exist.
     Returns Success or error message.
     """
     try:
-        path = Path(ROOT_DIR).joinpath(directory)
+        path = root_path() / directory
         path.mkdir(parents=True, exist_ok=True)
         path.chmod(0o755)
         return f"Successfully created directory {directory}"
     except Exception as e:
         return f"Failed to create directory {directory}: {str(e)}"
 
+def path_matches(parts: tuple, pattern: tuple) -> bool:
+    """Checks whether the trailing components of a path match the components of a glob pattern."""
+    return len(parts) >= len(pattern) and all(
+        fnmatch.fnmatch(part, component) for part, component in zip(parts[-len(pattern):], pattern)
+    )
+
 @tool
 def find_file(filename: str, path: str) -> Optional[str]:
     """
     Recursively searches for a file in the given path.
     Returns the path of the file if found, otherwise returns None.
     """
-    path_obj = Path(path)
-    for file in path_obj.rglob(filename):
-        return str(file)
+    root = root_path()
+    start = os.path.join(root, path)
+    # Like Path.rglob, a pattern with directories in it matches the trailing components of the path
+    pattern = Path(filename).parts
+    directories = deque([start])
+    while directories:
+        try:
+            with os.scandir(directories.popleft()) as entries:
+                for entry in entries:
+                    if fnmatch.fnmatch(entry.name, pattern[-1]) and (
+                        len(pattern) == 1 or path_matches(Path(os.path.relpath(entry.path, start)).parts, pattern)
+                    ):
+                        return os.path.relpath(entry.path, root)
+                    if entry.is_dir(follow_symlinks=False) and entry.name not in SKIPPED_DIRS:
+                        directories.append(entry.path)
+        except OSError:
+            continue
     return None
 
 
 
 @tool
+@writes_worktree
 def create_file(filename: str, content: str = "", directory=""):
     """
     Creates a new file and content in the specified directory. 
@@ -61,96 +337,159 @@ def create_file(filename: str, content: str = "", directory=""):
     Filetype must be in {"py", "txt", "md", "cpp", "c", "java", "js", "html", "css", "ts", "json"}
     """
     # Validate file type
-    try:
-        file_stem, file_type = filename.split(".")
-        assert file_type in VALID_FILE_TYPES
-    except:
-        return f"Invalid filename {filename} - must end with a valid file type: {VALID_FILE_TYPES}"
+    file_type = Path(filename).suffix[1:].lower()
+    if file_type not in VALID_FILE_TYPES:
+        return f"Invalid filename {filename} - must end with a valid file type: {set(VALID_FILE_TYPES)}"
     
-    create_directory(directory)
-    file_path = Path(ROOT_DIR).joinpath(directory).joinpath(filename)
-    if not file_path.exists():
-        try:
-            with file_path.open("w") as file:
-                file.write(content)
-            return f"Successfully created file {filename} at {file_path}"
-        except Exception as e:
-            return f"Failed to create file {filename} at {file_path}: {str(e)}"
-    else:
+    file_path = root_path() / directory / filename
+    try:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        return f"Failed to create file {filename} at {file_path}: {str(e)}"
+    try:
+        # Exclusive binary create, fails on an existing file and writes the newlines as given
+        with file_path.open("xb") as file:
+            file.write(content.encode("utf-8"))
+        return f"Successfully created file {filename} at {file_path}"
+    except FileExistsError:
         return f"File {filename} already exists at {file_path}."
+    except Exception as e:
+        return f"Failed to create file {filename} at {file_path}: {str(e)}"
     
 
+def capped_text(data, size: int) -> str:
+    """
+    Decodes file content for the LLM, keeping only the head and tail when larger than MAX_FILE_BYTES.
+    data can be anything sliceable into bytes, a mmap or a git blob.
+    """
+    if size <= MAX_FILE_BYTES:
+        content = data[:].decode("utf-8", errors="replace")
+    else:
+        head = data[:HEAD_FILE_BYTES].decode("utf-8", errors="replace")
+        tail = data[-TAIL_FILE_BYTES:].decode("utf-8", errors="replace")
+        content = f"{head}\n... [truncated {size - HEAD_FILE_BYTES - TAIL_FILE_BYTES} bytes] ...\n{tail}"
+    return content.replace("\r\n", "\n")
+
+@functools.lru_cache(maxsize=512)
+def read_file(path: str, mtime_ns: int, size: int) -> str:
+    """
+    Reads the file for the LLM, keeping only the head and tail of files larger than MAX_FILE_BYTES.
+    mtime_ns and size are part of the cache key, so a modified file is read again.
+    """
+    if size == 0:
+        return ""
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return capped_text(data, size)
+
 @tool
 def open_file(filename: str, directory: str = ROOT_DIR):
-    """Opens an existing file."""
-    file_path = Path(ROOT_DIR).joinpath(directory).joinpath(filename)
-    if not file_path.exists():
+    """
+    Opens an existing file.
+    Files larger than 64KB are returned with the middle truncated, use edit_lines to change them.
+    """
+    file_path = root_path() / directory / filename
+    try:
+        stat = file_path.stat()
+    except OSError:
         return f"File {filename} not found in {directory}."
     else:
         try:
-            with open(file_path, "r") as file:
-                return file.read()    
+            return read_file(str(file_path), stat.st_mtime_ns, stat.st_size)
         except Exception as e:
             return f"Failed to open file {filename} at {file_path}: {str(e)}"
 
 @tool
+@writes_worktree
 def replace_file(filename: str, content: str, directory: str = ROOT_DIR):
     """Updates an existing file by completely replacing its content."""
-    file_path = Path(ROOT_DIR).joinpath(directory).joinpath(filename)
+    file_path = root_path() / directory / filename
     if not file_path.exists():
         return f"File {filename} not found in {directory}."
     else:
         try:
-            with open(file_path, "w") as file:
-                file.write(content)
+            file_path.write_bytes(content.encode("utf-8"))
             return f"Successfully updated file {filename} at {file_path}"
         except Exception as e:
             return f"Failed to update file {filename} at {file_path}: {str(e)}"
         
 @tool
+@writes_worktree
 def append_file(filename: str, content: str, directory: str = ROOT_DIR):
     """Appends content to an existing file at the end."""
-    file_path = Path(ROOT_DIR).joinpath(directory).joinpath(filename)
+    file_path = root_path() / directory / filename
     if not file_path.exists():
         return f"File {filename} not found in {directory}."
     else:
         try:
-            with open(file_path, "a") as file:
-                file.write(content)
+            with file_path.open("ab") as file:
+                file.write(content.encode("utf-8"))
             return f"Successfully appended content to file {filename} at {file_path}"
         except Exception as e:
             return f"Failed to append content to file {filename} at {file_path}: {str(e)}"
 
 # AI-GEN START - cursor
 @tool
+@writes_worktree
 def edit_lines(filename: str, start_line: int, end_line: int, new_content: str, directory: str = ROOT_DIR) -> str:
     """
     Replaces lines in an existing file between start_line and end_line (inclusive) with new_content. The line numbers start with 1.    
     Returns a message indicating success or failure.
     """
-    file_path = Path(ROOT_DIR).joinpath(directory).joinpath(filename)
+    file_path = root_path() / directory / filename
     if not file_path.exists():
         return f"File {filename} not found in {directory}."
     
+    if start_line < 1 or start_line > end_line:
+        return f"Invalid line range specified for file {filename}."
+    
+    tmp_path = None
     try:
-        with open(file_path, "r") as file:
-            lines = file.readlines()
+        # Stream the file into a temporary sibling and swap it in, only the edited lines are held in memory
+        line_count = 0
+        with open(file_path, "r", buffering=1 << 16, encoding="utf-8", newline="") as file, tempfile.NamedTemporaryFile(
+            "w", dir=file_path.parent, delete=False, encoding="utf-8", newline=""
+        ) as tmp:
+            tmp_path = tmp.name
+            terminator = "\n"
+            for line_count, line in enumerate(file, 1):
+                if line_count == 1:
+                    # The new content takes the line endings of the file
+                    terminator = line[len(line.rstrip("\r\n")):] or terminator
+                if line_count < start_line or line_count > end_line:
+                    tmp.write(line)
+                elif line_count == start_line:
+                    tmp.write(re.sub(r"\r\n|\r|\n", terminator, new_content) + terminator)
         
-        if start_line < 1 or end_line > len(lines) or start_line > end_line:
+        if end_line > line_count:
             return f"Invalid line range specified for file {filename}."
         
-        # Replace the specified lines with new content
-        lines[start_line-1:end_line] = [new_content + "\n"]
-        
-        with open(file_path, "w") as file:
-            file.writelines(lines)
-        
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+        tmp_path = None
         return f"Successfully edited lines {start_line} to {end_line} in file {file_path}"
     except Exception as e:
         return f"Failed to edit file {file_path}: {str(e)}"
+    finally:
+        if tmp_path is not None:
+            os.unlink(tmp_path)
 # AI-GEN END
 
 
+@functools.lru_cache(maxsize=512)
+def list_directory(path: str, mtime_ns: int) -> tuple[tuple, tuple]:
+    """
+    Splits the directory entries into files and directories in a single os.scandir pass.
+    mtime_ns is part of the cache key, so the listing is refreshed when an entry is added or removed.
+    """
+    files, directories = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                directories.append(entry.name)
+            elif entry.is_file():
+                files.append(entry.name)
+    return tuple(files), tuple(directories)
+
 @tool
 def ls(directory: str = ROOT_DIR) -> dict:
     """
@@ -158,37 +497,120 @@ def ls(directory: str = ROOT_DIR) -> dict:
     Returns:
         dict:  with keys "current_directory", "files", "directories"
     """
-    if not os.path.exists(directory):
+    path = os.path.join(root_path(), directory)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
         return f"Directory {directory} not found."
     
     try:
-        files_and_dirs = os.listdir(directory)
+        files, directories = list_directory(path, mtime_ns)
         return {
             "current_directory": directory,            
-            "files": [f for f in files_and_dirs if os.path.isfile(os.path.join(directory, f))],
-            "directories": [d for d in files_and_dirs if os.path.isdir(os.path.join(directory, d))]
+            "files": list(files),
+            "directories": list(directories)
         }
     except Exception as e:
         return f"Failed to list directory contents: {str(e)}"
 
+async def read_stream(stream: asyncio.StreamReader) -> str:
+    """
+    Reads the stream in chunks keeping the first MAX_OUTPUT_BYTES, lines of any length included.
+    The rest is drained and dropped so the process never blocks on a full pipe.
+    """
+    output = bytearray()
+    while chunk := await stream.read(1 << 16):
+        if len(output) < MAX_OUTPUT_BYTES:
+            output += chunk[:MAX_OUTPUT_BYTES - len(output)]
+    return output.decode("utf-8", errors="replace")
+
+async def run_command(args: list, cwd: str) -> subprocess.CompletedProcess:
+    """
+    Runs the command without blocking the event loop, killing it after COMMAND_TIMEOUT seconds.
+    The process is killed and reaped whenever the command doesn't complete.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd
+    )
+    try:
+        stdout, stderr, returncode = await asyncio.wait_for(
+            asyncio.gather(read_stream(process.stdout), read_stream(process.stderr), process.wait()),
+            timeout=COMMAND_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{' '.join(args)} did not finish in {COMMAND_TIMEOUT} seconds")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+async def compile_project(cwd: str) -> tuple[str, bool]:
+    result = await run_command(["yarn", "install"], cwd)
+    if result.returncode != 0:
+        # Usually a network issue, not worth remembering
+        return f"Failed to install frozen lockfile: {result.stderr}", False
+    result = await run_command(["npm", "run", "analyze-code"], cwd)
+    if result.returncode == 0:
+        return f"Compilation successful", True
+    else:
+        return f"Compilation failed: {result.stdout} {result.stderr}", True
+
+async def lint_project(cwd: str) -> tuple[str, bool]:
+    result = await run_command(["npm", "run", "lint"], cwd)
+    if result.returncode == 0:
+        return f"Linting successful", True
+    else:
+        return f"Linting failed: {result.stderr}", True
+
+def working_tree_hash() -> str:
+    """
+    Hashes the HEAD commit together with every change on top of it, untracked files included.
+    """
+    repo = repository()
+    diff = repo.diff(
+        "HEAD",
+        flags=pygit2.GIT_DIFF_INCLUDE_UNTRACKED
+        | pygit2.GIT_DIFF_RECURSE_UNTRACKED_DIRS
+        | pygit2.GIT_DIFF_SHOW_UNTRACKED_CONTENT,
+    )
+    digest = hashlib.sha256(str(repo.head.target).encode("utf-8"))
+    digest.update((diff.patch or "").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def cached_check(name: str, check) -> str:
+    """
+    Returns the result of the check from a previous run on an identical working tree, or runs it.
+    Results are only stored when the check left the tree unchanged, so lint fixes are never skipped.
+    """
+    key = working_tree_hash()
+    cache_path = CHECKS_CACHE_DIR / f"{name}-{key}.json"
+    try:
+        return json.loads(cache_path.read_text(encoding="utf-8"))["result"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    result, cacheable = check()
+    if cacheable and working_tree_hash() == key:
+        CHECKS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Other workers read the directory concurrently, only complete files may appear under the final name
+        with tempfile.NamedTemporaryFile("w", dir=CHECKS_CACHE_DIR, delete=False, encoding="utf-8") as tmp:
+            tmp.write(json.dumps({"result": result}))
+        os.replace(tmp.name, cache_path)
+    return result
+
 @tool
+@writes_worktree
 def compile():
     """
     Compiles the project return Success or compilation error message.
     """
     try:
-        result = subprocess.run(["yarn", "install"], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode != 0:
-            return f"Failed to install frozen lockfile: {result.stderr}"
-        result = subprocess.run(["npm", "run", "analyze-code"], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode == 0:
-            return f"Compilation successful"
-        else:
-            return f"Compilation failed: {result.stdout} {result.stderr}"
+        return cached_check("compile", lambda: asyncio.run(compile_project(repo_dir())))
     except Exception as e:
         return f"Failed to run compile command: {str(e)}"
     
 @tool
+@writes_worktree
 def lint() -> str:
     """
     Runs the linting process on the project with fixing enabled. 
@@ -197,15 +619,12 @@ def lint() -> str:
         str: Result message indicating success or failure.
     """
     try:
-        result = subprocess.run(["npm", "run", "lint"], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode == 0:
-            return f"Linting successful"
-        else:
-            return f"Linting failed: {result.stderr}"
+        return cached_check("lint", lambda: asyncio.run(lint_project(repo_dir())))
     except Exception as e:
         return f"Failed to run lint command: {str(e)}"
     
 @tool
+@writes_worktree
 def create_and_push_branch(branch_name: str, commit_message: str) -> str:
     """
     Creates a new branch and adds all the changes to it.
@@ -218,23 +637,36 @@ def create_and_push_branch(branch_name: str, commit_message: str) -> str:
         str: Result message indicating success or failure.
     """
     try:
-        # Create a new branch
-        result = subprocess.run(["git", "checkout", "-b", branch_name], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode != 0:
-            return f"Failed to create branch: {result.stderr}"
+        repo = repository()
+        head = repo.head.peel(pygit2.Commit)
+
+        # Create a new branch, the working tree already matches its tip so only HEAD moves
+        try:
+            branch = repo.branches.local.create(branch_name, head)
+            repo.set_head(branch.name)
+        except Exception as e:
+            return f"Failed to create branch: {str(e)}"
         
-        # Add all changes
-        result = subprocess.run(["git", "add", "."], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode != 0:
-            return f"Failed to add changes: {result.stderr}"
+        # Add all changes, deleted files included
+        index = repo.index
+        index.add_all()
+        for path, flags in repo.status().items():
+            if flags & pygit2.GIT_STATUS_WT_DELETED:
+                index.remove(path)
+        index.write()
         
         # Commit the changes
-        result = subprocess.run(["git", "commit", "-nm", commit_message], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode != 0:
-            return f"Failed to commit changes: {result.stderr}"
+        tree = index.write_tree()
+        if tree == head.tree_id:
+            return "Failed to commit changes: nothing to commit"
+        signature = repo.default_signature
+        repo.create_commit("HEAD", signature, signature, commit_message, tree, [head.id])
      
-        # Push the changes to the remote repository
-        result = subprocess.run(["git", "push", "--set-upstream", "origin", branch_name], capture_output=True, text=True, cwd=REPO_DIR)
+        # Push the changes to the remote repository, git handles the credentials
+        result = subprocess.run(
+            ["git", "push", "--atomic", "--force-with-lease", "--set-upstream", "origin", branch_name],
+            capture_output=True, text=True, cwd=repo_dir()
+        )
         if result.returncode != 0:
             return f"Failed to push branch: {result.stderr}"
              
@@ -250,16 +682,13 @@ def git_diff() -> str:
         str: The git diff output or an error message.
     """
     try:
-        result = subprocess.run(["git", "diff"], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode == 0:
-            return result.stdout
-        else:
-            return f"Failed to get git diff: {result.stderr}"
+        return repository().diff().patch or ""
     except Exception as e:
         return f"Failed to run git diff command: {str(e)}"
 
 # AI-GEN START - cursor
 @tool
+@writes_worktree
 def git_reset() -> str:
     """
     Resets the current Git repository to the last commit. Use this if you want to start from scratch.
@@ -268,20 +697,38 @@ def git_reset() -> str:
         str: Result message indicating success or failure.
     """
     try:
-        result = subprocess.run(["git", "reset", "--hard"], capture_output=True, text=True, cwd=REPO_DIR)
-        if result.returncode == 0:
-            return "Successfully reset the repository to the last commit."
-        else:
-            return f"Failed to reset the repository: {result.stderr}"
+        repo = repository()
+        repo.reset(repo.head.target, pygit2.GIT_RESET_HARD)
+        return "Successfully reset the repository to the last commit."
     except Exception as e:
         return f"Failed to run git reset command: {str(e)}"
 # AI-GEN END
 
 
 
+class WorkerShellTool(ShellTool):
+    """
+    ShellTool running the commands in the worker root instead of the process cwd.
+    Confirmation prompts are taken one at a time so parallel workers don't interleave on stdin.
+    """
+
+    def _run(self, commands, run_manager=None) -> str:
+        if isinstance(commands, list):
+            commands = "\n".join(commands)
+        with shell_input_lock:
+            print(f"Executing command in {root_path()}:\n {commands}")
+            if self.ask_human_input and input("Proceed with command execution? (y/n): ").lower() != "y":
+                return "User aborted command execution."
+        try:
+            with worktree_lock():
+                result = subprocess.run(commands, shell=True, capture_output=True, text=True, cwd=root_path())
+            return result.stdout + result.stderr
+        except Exception as e:
+            return f"Failed to run shell command: {str(e)}"
+
 # List of tools to use
 tools = [
-    ShellTool(ask_human_input=True), 
+    WorkerShellTool(ask_human_input=True), 
     create_directory, 
     open_file,
     find_file, 
@@ -299,12 +746,9 @@ tools = [
 # Configure the language model
 llm = ChatOpenAI(model="gpt-4o", temperature=0, max_tokens=4000, max_retries=5)
 
-# Set up the prompt template
-prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            """
+# Static system prompt. It stays first and byte-identical across calls so OpenAI prompt caching applies,
+# and it is passed as a message rather than a template so the Handlebars {{...}} reach the model untouched.
+SYSTEM_PROMPT = """
 You are an expert TypeScript developer working on the cloudfix-aws project. This project contains a tree structure of directories and files for various finders, located in the cloudfix-aws/cloudfix-ff/src/ff directory. Each finder has a ValidatorService.ts file that contains the validation logic.
 You don't have to describe the modifications being made use the provided tools to make the changes. When editing lines prefer to edit block of code in a single request.
 If there you face many errors use reset tool to start from scratch.
@@ -441,15 +885,50 @@ Compile the project and fix any issues that arise.
 Lint the project to ensure that the implementation is compliant with the linting rules.
 You use several attempt to make sure that the code is compliant, but no more than 10. If that fails, just submit the prepared code.
 Create a new branch and add all the changes to it.
-            """,
-        ),
+            """
+
+# Set up the prompt template
+prompt = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PROMPT),
         ("user", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ]
 )
 
-# Bind the tools to the language model
-llm_with_tools = llm.bind_tools(tools)
+def strip_titles(schema, properties: bool = False):
+    """Removes the pydantic generated titles from a JSON schema, keeping properties that happen to be named title."""
+    if isinstance(schema, dict):
+        return {
+            key: strip_titles(value, properties=(key == "properties" and not properties))
+            for key, value in schema.items()
+            if properties or key != "title"
+        }
+    if isinstance(schema, list):
+        return [strip_titles(value) for value in schema]
+    return schema
+
+def compact_tool_schema(schema: dict) -> dict:
+    """
+    Shrinks the OpenAI schema of a tool: the signature LangChain prepends to the description is dropped
+    (the parameters already describe it), whitespace is collapsed and titles are removed.
+    """
+    function = schema["function"]
+    description = re.sub(rf"^{re.escape(function['name'])}\(.*?\)(?: -> [^\n]*?)? - ", "", function["description"], flags=re.S)
+    return {
+        "type": "function",
+        "function": {
+            "name": function["name"],
+            "description": " ".join(description.split()),
+            "parameters": strip_titles(function["parameters"]),
+        },
+    }
+
+# Tool schema sent with every request, built once
+TOOLS_SCHEMA = tuple(compact_tool_schema(convert_to_openai_tool(t)) for t in tools)
+
+# Bind the tools to the language model, allowing several tool calls per turn
+llm_with_tools = llm.bind(tools=list(TOOLS_SCHEMA), parallel_tool_calls=True)
 
 # Create the agent
 agent = (
@@ -465,7 +944,68 @@ agent = (
 )
 
 # Create the agent executor
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=False, handle_parsing_errors=True, max_iterations=50)
+class NoProgressError(Exception):
+    """Raised when the agent keeps repeating the same tool call."""
+
+class AgentLimitError(Exception):
+    """Raised when the agent is stopped at MAX_AGENT_ITERATIONS or MAX_AGENT_EXECUTION_TIME."""
+
+# AgentExecutor doesn't raise at its limits, it finishes with this output instead
+LIMIT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+class NoProgressCallback(BaseCallbackHandler):
+    """
+    Stops an agent run once its last NO_PROGRESS_REPEATS tool calls were identical.
+    One instance serves all the concurrent runs, the history is kept per run.
+    """
+
+    raise_error = True
+
+    def __init__(self):
+        self.history: dict[UUID, deque] = {}
+        self.lock = threading.Lock()
+
+    def on_agent_action(self, action: AgentAction, *, run_id: UUID, **kwargs: Any) -> None:
+        call = (action.tool, json.dumps(action.tool_input, sort_keys=True, default=str))
+        with self.lock:
+            calls = self.history.setdefault(run_id, deque(maxlen=NO_PROGRESS_REPEATS))
+            calls.append(call)
+            stuck = len(calls) == NO_PROGRESS_REPEATS and len(set(calls)) == 1
+        if stuck:
+            raise NoProgressError(f"{action.tool} called {NO_PROGRESS_REPEATS} times in a row with the same input")
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self.lock:
+            self.history.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self.lock:
+            self.history.pop(run_id, None)
+
+agent_executor = AgentExecutor(
+    agent=agent,
+    tools=tools,
+    verbose=False,
+    handle_parsing_errors=True,
+    max_iterations=MAX_AGENT_ITERATIONS,
+    max_execution_time=MAX_AGENT_EXECUTION_TIME,
+    callbacks=[NoProgressCallback()],
+)
+
+async def run_agent(task: str, stop: Optional[asyncio.Event] = None) -> bool:
+    """
+    Runs the agent on the async path, which executes the tool calls of a turn concurrently, writes one at a time.
+    Once stop is set the run ends at the next step, where no tool is running, and False is returned.
+    Raises AgentLimitError when the agent ran out of iterations or time, so the attempt counts as failed.
+    """
+    async for chunk in agent_executor.astream({"input": task}):
+        if stop is not None and stop.is_set():
+            return False
+        if chunk.get("output") == LIMIT_STOPPED_OUTPUT:
+            raise AgentLimitError(
+                f"stopped after {MAX_AGENT_ITERATIONS} iterations or {MAX_AGENT_EXECUTION_TIME} seconds"
+            )
+    return True
 
 # Main loop to prompt the user
 
@@ -548,20 +1088,235 @@ finders = [
     "cloudfix-aws/cloudfix-ff/src/ff/Kendra/Delete/IdleIndices"
 ]
 
-for finder in finders:
-    retry_attempts = 5
-    for attempt in range(5):
-        print(f"{finder} - attempt {attempt + 1} of 5")
-        subprocess.run(["git", "reset", "--hard"], check=True, cwd=REPO_DIR)
-        subprocess.run(["git", "checkout", "qa"], check=True, cwd=REPO_DIR)
-        subprocess.run(["git", "reset", "--hard"], check=True, cwd=REPO_DIR)
-        subprocess.run(["git", "clean", "-fd"], check=True, cwd=REPO_DIR)
+def create_worktrees() -> "queue.Queue[Path]":
+    """
+    Creates one detached git worktree of the base branch per worker, so the workers never share a checkout.
+    Returns a queue with the root directories of the worktrees.
+    """
+    roots = queue.Queue()
+    for i in range(MAX_WORKERS + SPARE_WORKTREES):
+        root = ROOT_PATH / WORKTREES_DIR / f"wt-{i}"
+        checkout = root / REPO_DIR
+        if not checkout.exists():
+            subprocess.run(["git", "worktree", "add", "--detach", str(checkout), BASE_BRANCH], check=True, cwd=REPO_DIR)
+        roots.put(root)
+    return roots
+
+def base_tree() -> pygit2.Tree:
+    """
+    Returns the tree of the base branch, which is what every worktree is reset to.
+    The main checkout can be left on any branch by earlier runs, so it is not read directly.
+    """
+    return pygit2.Repository(REPO_DIR).revparse_single(BASE_BRANCH).peel(pygit2.Tree)
+
+def read_base_file(tree: pygit2.Tree, path: str) -> str:
+    """Reads a file of the base branch, path is relative to ROOT_DIR like the finder paths."""
+    blob = tree[Path(path).relative_to(REPO_DIR).as_posix()]
+    return capped_text(blob.data, blob.size)
+
+def index_validators(tree: pygit2.Tree) -> dict:
+    """
+    Reads every ValidatorService.ts under the finders directory of the base branch once, capped like open_file.
+    Returns a dict mapping the finder path to its validator source.
+    """
+    validators = {}
+    finders_dir = Path(FINDERS_DIR)
+    directories = deque([(finders_dir, tree[finders_dir.relative_to(REPO_DIR).as_posix()])])
+    while directories:
+        path, directory = directories.popleft()
+        for entry in directory:
+            if entry.type_str == "tree":
+                if entry.name not in SKIPPED_DIRS:
+                    directories.append((path / entry.name, entry))
+            elif entry.name == "ValidatorService.ts":
+                finder_dir = path.parent if path.name == "finder" else path
+                validators[finder_dir.as_posix()] = capped_text(entry.data, entry.size)
+    return validators
+
+def draft_messages(finder: str, validators: dict, tree: pygit2.Tree) -> list:
+    """
+    Builds the chat messages asking for a draft of the report for the given finder.
+    The draft needs no tools, so it can be answered offline by the Batch API.
+    """
+    reference_template = read_base_file(tree, f"{REFERENCE_FINDER}/Main.ts")
+    reference_validator = validators[REFERENCE_FINDER]
+    validator = validators[finder]
+    return [
+        {
+            "role": "system",
+            "content": "You are an expert TypeScript developer working on the cloudfix-aws project. "
+            "Each finder needs a Handlebars ReportTemplate in its Main.ts and a finderReportData field "
+            "populated for every recommendation in its ValidatorService.ts.",
+        },
+        {
+            "role": "user",
+            "content": f"Reference Main.ts:\n{reference_template}\n\n"
+            f"Reference ValidatorService.ts:\n{reference_validator}\n\n"
+            f"ValidatorService.ts of {finder}:\n{validator}\n\n"
+            "Draft the ReportTemplate for this finder and the code populating item.finderReportData. "
+            "Only use values the validator already gathers.",
+        },
+    ]
+
+def draft_reports(finders: list, validators: dict, tree: pygit2.Tree) -> dict:
+    """
+    Submits the report drafts of all the finders as one OpenAI batch and waits up to BATCH_MAX_WAIT for it.
+    Returns a dict mapping the finder path to its draft, finders that failed are left out.
+    Returns an empty dict when the batch can't be submitted, fails or takes too long.
+    """
+    client = OpenAI()
+    requests = []
+    for finder in finders:
         try:
-            list(agent_executor.stream({"input": "Your task is to implement the report for the finder located in "+finder}))
-            break
+            messages = draft_messages(finder, validators, tree)
         except Exception as e:
-            print(f"Attempt {attempt + 1} failed: {e}");
-            # AI-GEN START - cursor
-        branch_name = f"{finder.replace('/', '_')}_attempt_{attempt + 1}"
-        create_and_push_branch.func(branch_name,"Partial implementation for "+finder)
+            print(f"{finder} - skipping draft: {e}")
+            continue
+        requests.append(json.dumps({
+            "custom_id": finder,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": llm.model_name, "temperature": 0, "max_tokens": 4000, "messages": messages},
+        }))
+    if not requests:
+        return {}
 
+    try:
+        batch_file = client.files.create(file=("drafts.jsonl", "\n".join(requests).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        deadline = time.monotonic() + BATCH_MAX_WAIT
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() >= deadline:
+                print(f"Draft batch {batch.id} not done after {BATCH_MAX_WAIT} seconds, continuing without drafts")
+                client.batches.cancel(batch.id)
+                return {}
+            print(f"Draft batch {batch.id} - {batch.status}")
+            time.sleep(BATCH_POLL_INTERVAL)
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"Draft batch {batch.id} {batch.status}, continuing without drafts")
+            return {}
+
+        drafts = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            try:
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") == 200:
+                    drafts[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                print(f"Skipping malformed draft result: {e}")
+        return drafts
+    except Exception as e:
+        print(f"Draft batch failed, continuing without drafts: {e}")
+        return {}
+
+def build_task(finder: str, validator: Optional[str] = None, draft: Optional[str] = None) -> str:
+    """
+    Builds the agent input for the finder, with its validator and draft inlined so the agent doesn't have to read them.
+    """
+    task = "Your task is to implement the report for the finder located in "+finder
+    if validator:
+        task += f"\n\nContent of {finder}/finder/ValidatorService.ts:\n" + validator
+    if draft:
+        task += "\n\nA draft of the report prepared for this finder, verify it against the code before using it:\n" + draft
+    return task
+
+async def run_attempt(finder: str, task: str, attempt: int, root: Path, stop: asyncio.Event) -> bool:
+    """
+    Runs one attempt of the agent in the given worktree, pushing the partial work if it fails.
+    Returns True when the agent finished, False when it failed or was stopped.
+    """
+    worker_root.set(root)
+    print(f"{finder} - attempt {attempt + 1} of {RETRY_ATTEMPTS}")
+    await asyncio.to_thread(reset_to_base_branch)
+    if stop.is_set():
+        return False
+    try:
+        return await run_agent(task, stop)
+    except Exception as e:
+        print(f"Attempt {attempt + 1} failed: {e}");
+    # AI-GEN START - cursor
+    branch_name = f"{finder.replace('/', '_')}_attempt_{attempt + 1}"
+    await asyncio.to_thread(create_and_push_branch.func, branch_name, "Partial implementation for "+finder)
+    return False
+
+def borrow_spare(roots: "queue.Queue[Path]") -> Optional[tuple[Path, threading.Semaphore]]:
+    """
+    Takes a free worktree and slot for a hedged attempt, without waiting for either.
+    A hedge slot is preferred, an agent slot left free towards the end of the sweep is used otherwise.
+    Returns the worktree with the semaphore its slot has to be released to.
+    """
+    for slots in (hedge_slots, agent_slots):
+        if slots.acquire(blocking=False):
+            break
+    else:
+        return None
+    try:
+        return roots.get_nowait(), slots
+    except queue.Empty:
+        slots.release()
+        return None
+
+async def hedge_attempts(finder: str, task: str, root: Path, roots: "queue.Queue[Path]"):
+    """
+    Runs the attempts of a finder one after another, but when the running attempts take longer than
+    HEDGE_DELAY a parallel attempt is started in a spare worktree. The first finished attempt wins,
+    the others are stopped and waited for, so no tool is still running in a worktree given back.
+    """
+    stop = asyncio.Event()
+    free_roots = [root]
+    spare_roots = []
+    running = {}
+    attempt = 0
+    try:
+        while attempt < RETRY_ATTEMPTS or running:
+            while free_roots and attempt < RETRY_ATTEMPTS:
+                attempt_root = free_roots.pop()
+                running[asyncio.create_task(run_attempt(finder, task, attempt, attempt_root, stop))] = attempt_root
+                attempt += 1
+            done, _ = await asyncio.wait(running, timeout=HEDGE_DELAY, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if attempt < RETRY_ATTEMPTS and (spare := borrow_spare(roots)):
+                    spare_roots.append(spare)
+                    free_roots.append(spare[0])
+                continue
+            for finished in done:
+                free_roots.append(running.pop(finished))
+                if finished.result():
+                    return
+    finally:
+        stop.set()
+        await asyncio.gather(*running, return_exceptions=True)
+        for spare, slots in spare_roots:
+            roots.put(spare)
+            slots.release()
+
+def process_finder(finder: str, roots: "queue.Queue[Path]", task: str) -> str:
+    """
+    Runs the agent for a single finder inside a worktree borrowed from the pool.
+    Returns the finder path once all the attempts are done.
+    """
+    root = roots.get()
+    try:
+        with agent_slots:
+            asyncio.run(hedge_attempts(finder, task, root, roots))
+        return finder
+    finally:
+        roots.put(root)
+
+if __name__ == "__main__":
+    tree = base_tree()
+    validators = index_validators(tree)
+    drafts = draft_reports(finders, validators, tree) if BATCH_DRAFTS else {}
+    roots = create_worktrees()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(process_finder, finder, roots, build_task(finder, validators.get(finder), drafts.get(finder))): finder
+            for finder in finders
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"{future.result()} - done")
+            except Exception as e:
+                print(f"{futures[future]} failed: {e}")
@@ -0,0 +1,260 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langchain_core.caches import InMemoryCache
+from langchain_core.outputs import Generation
+from langchain_openai import ChatOpenAI
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+# agent creates its LLM cache files in the working directory
+os.chdir(tempfile.mkdtemp())
+
+import agent
+
+
+class LetterEmbeddings:
+    """Embeds text as letter frequencies, so near-identical prompts end up close."""
+
+    def embed_query(self, text: str) -> list:
+        vector = np.zeros(26)
+        for char in text.lower():
+            if "a" <= char <= "z":
+                vector[ord(char) - ord("a")] += 1
+        return list(vector)
+
+
+def llm_string(llm) -> str:
+    return llm.bound._get_llm_string(**llm.kwargs) if hasattr(llm, "bound") else llm._get_llm_string()
+
+
+def test_semantic_cache_hits_near_duplicate_prompt():
+    cache = agent.SemanticCache(InMemoryCache(), embeddings=LetterEmbeddings())
+    key = llm_string(agent.llm_with_tools)
+    prompt = "Your task is to implement the report for the finder located in Ebs/Delete/IdleVolumes"
+    answer = [Generation(text="done")]
+
+    assert cache.lookup(prompt, key) is None
+    cache.update(prompt, key, answer)
+
+    assert cache.lookup(prompt.replace("IdleVolumes", "IdleVolume"), key) == answer
+    assert cache.lookup("Something else entirely, unrelated xyz", key) is None
+    assert cache.pending.keys() == {("Something else entirely, unrelated xyz", key)}
+
+
+def test_semantic_cache_skips_sampled_models():
+    cache = agent.SemanticCache(InMemoryCache(), embeddings=LetterEmbeddings())
+    key = llm_string(ChatOpenAI(model="gpt-4o", temperature=0.7))
+    prompt = "Your task is to implement the report"
+
+    cache.update(prompt, key, [Generation(text="done")])
+
+    assert cache.lookup(prompt + "s", key) is None
+
+
+def test_create_file_reports_directory_errors(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    (tmp_path / "taken").write_text("")
+
+    try:
+        result = agent.create_file.invoke({"filename": "Main.ts", "directory": "taken"})
+    finally:
+        agent.worker_root.reset(token)
+
+    assert result.startswith("Failed to create file Main.ts")
+
+
+def test_edit_lines_keeps_utf8_and_line_endings(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    (tmp_path / "Main.ts").write_bytes("const a = 'żółw';\r\nconst b = 1;\r\nconst c = 2;\r\n".encode("utf-8"))
+
+    try:
+        result = agent.edit_lines.invoke({"filename": "Main.ts", "start_line": 2, "end_line": 2, "new_content": "const b = 'é';\nconst d = 3;"})
+    finally:
+        agent.worker_root.reset(token)
+
+    assert result.startswith("Successfully edited lines 2 to 2")
+    assert (tmp_path / "Main.ts").read_bytes() == "const a = 'żółw';\r\nconst b = 'é';\r\nconst d = 3;\r\nconst c = 2;\r\n".encode("utf-8")
+
+
+def test_cached_check_ignores_partial_files_and_reuses_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, "CHECKS_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(agent, "working_tree_hash", lambda: "abc")
+    (tmp_path / "lint-abc.json").write_text('{"res')
+    runs = []
+
+    def check():
+        runs.append(1)
+        return "Linting successful", True
+
+    assert agent.cached_check("lint", check) == "Linting successful"
+    assert agent.cached_check("lint", check) == "Linting successful"
+    assert len(runs) == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["lint-abc.json"]
+
+
+def test_validators_are_read_from_the_base_branch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    finder = "cloudfix-aws/cloudfix-ff/src/ff/Ebs/Delete/IdleVolumes"
+    validator = tmp_path / finder / "finder" / "ValidatorService.ts"
+    validator.parent.mkdir(parents=True)
+    validator.write_text("qa validator")
+    (tmp_path / finder / "Main.ts").write_text("qa template")
+
+    repo = agent.pygit2.init_repository("cloudfix-aws", initial_head=agent.BASE_BRANCH)
+    repo.index.add_all()
+    repo.index.write()
+    signature = agent.pygit2.Signature("test", "test@example.com")
+    repo.create_commit("HEAD", signature, signature, "qa", repo.index.write_tree(), [])
+    validator.write_text("agent branch leftovers")
+
+    tree = agent.base_tree()
+
+    assert agent.index_validators(tree) == {finder: "qa validator"}
+    assert agent.read_base_file(tree, f"{finder}/Main.ts") == "qa template"
+
+
+def test_hedge_waits_for_the_losing_attempt_before_returning_its_worktree(tmp_path, monkeypatch):
+    first, spare = tmp_path / "first", tmp_path / "spare"
+    roots = agent.queue.Queue()
+    roots.put(spare)
+    finished = []
+
+    async def fake_run_agent(task, stop):
+        if agent.worker_root.get() == first:
+            while not stop.is_set():
+                await agent.asyncio.sleep(0.01)
+            await agent.asyncio.to_thread(agent.time.sleep, 0.05)
+            finished.append(first)
+            return False
+        return True
+
+    monkeypatch.setattr(agent, "HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(agent, "reset_to_base_branch", lambda: None)
+    monkeypatch.setattr(agent, "run_agent", fake_run_agent)
+    agent.asyncio.run(agent.hedge_attempts("finder", "task", first, roots))
+
+    assert finished == [first]
+    assert roots.get_nowait() == spare
+    assert agent.hedge_slots.acquire(blocking=False)
+    agent.hedge_slots.release()
+
+
+class FakeBatchClient:
+    """OpenAI client whose batch never finishes, optionally failing on upload."""
+
+    def __init__(self, upload_error=None):
+        self.upload_error = upload_error
+        self.cancelled = []
+        self.files = SimpleNamespace(create=self.create_file)
+        self.batches = SimpleNamespace(
+            create=lambda **kwargs: SimpleNamespace(id="batch", status="in_progress"),
+            retrieve=lambda batch_id: SimpleNamespace(id=batch_id, status="in_progress"),
+            cancel=self.cancelled.append,
+        )
+
+    def create_file(self, **kwargs):
+        if self.upload_error:
+            raise self.upload_error
+        return SimpleNamespace(id="file")
+
+
+def test_draft_reports_continue_without_drafts_on_errors(monkeypatch):
+    client = FakeBatchClient(upload_error=ConnectionError("network down"))
+    monkeypatch.setattr(agent, "OpenAI", lambda: client)
+    monkeypatch.setattr(agent, "draft_messages", lambda finder, validators, tree: [])
+
+    assert agent.draft_reports(["finder"], {}, None) == {}
+
+
+def test_draft_reports_stop_waiting_after_the_max_wait(monkeypatch):
+    client = FakeBatchClient()
+    monkeypatch.setattr(agent, "OpenAI", lambda: client)
+    monkeypatch.setattr(agent, "draft_messages", lambda finder, validators, tree: [])
+    monkeypatch.setattr(agent, "BATCH_MAX_WAIT", 0)
+
+    assert agent.draft_reports(["finder"], {}, None) == {}
+    assert client.cancelled == ["batch"]
+
+
+def test_find_file_matches_patterns_with_directories(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    validator = tmp_path / "ff" / "Ebs" / "finder" / "ValidatorService.ts"
+    validator.parent.mkdir(parents=True)
+    validator.write_text("")
+    (tmp_path / "ff" / "ValidatorService.ts").write_text("")
+
+    try:
+        nested = agent.find_file.invoke({"filename": "finder/ValidatorService.ts", "path": "ff"})
+        missing = agent.find_file.invoke({"filename": "other/ValidatorService.ts", "path": "ff"})
+    finally:
+        agent.worker_root.reset(token)
+
+    assert nested == str(Path("ff", "Ebs", "finder", "ValidatorService.ts"))
+    assert missing is None
+
+
+def test_run_command_keeps_the_output_of_long_lines():
+    script = "import sys; sys.stdout.write('x' * 200000)"
+    result = agent.asyncio.run(agent.run_command([sys.executable, "-c", script], "."))
+
+    assert result.returncode == 0
+    assert result.stdout == "x" * agent.MAX_OUTPUT_BYTES
+
+
+def test_concurrent_edits_of_the_same_file_are_both_kept(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    (tmp_path / "Main.ts").write_text("".join(f"line {i}\n" for i in range(1, 20001)))
+
+    async def edit_both():
+        return await agent.asyncio.gather(
+            agent.edit_lines.ainvoke({"filename": "Main.ts", "start_line": 1, "end_line": 1, "new_content": "first"}),
+            agent.edit_lines.ainvoke({"filename": "Main.ts", "start_line": 20000, "end_line": 20000, "new_content": "last"}),
+        )
+
+    try:
+        results = agent.asyncio.run(edit_both())
+    finally:
+        agent.worker_root.reset(token)
+
+    assert all(result.startswith("Successfully edited") for result in results)
+    lines = (tmp_path / "Main.ts").read_text().splitlines()
+    assert (lines[0], lines[-1]) == ("first", "last")
+
+
+def test_ls_reports_paths_through_a_file_as_not_found(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    (tmp_path / "Main.ts").write_text("")
+
+    try:
+        result = agent.ls.invoke({"directory": "Main.ts/finder"})
+    finally:
+        agent.worker_root.reset(token)
+
+    assert result == "Directory Main.ts/finder not found."
+
+
+def test_open_file_reports_paths_through_a_file_as_not_found(tmp_path):
+    token = agent.worker_root.set(tmp_path)
+    (tmp_path / "Main.ts").write_text("")
+
+    try:
+        result = agent.open_file.invoke({"filename": "ValidatorService.ts", "directory": "Main.ts"})
+    finally:
+        agent.worker_root.reset(token)
+
+    assert result == "File ValidatorService.ts not found in Main.ts."
+
+
+def test_run_agent_fails_when_the_executor_hits_its_limits(monkeypatch):
+    async def astream(inputs):
+        yield {"output": agent.LIMIT_STOPPED_OUTPUT}
+
+    monkeypatch.setattr(agent, "agent_executor", SimpleNamespace(astream=astream))
+
+    with pytest.raises(agent.AgentLimitError):
+        agent.asyncio.run(agent.run_agent("task"))